@@ -3,10 +3,22 @@ import os
 import atexit
 import logging
 import json
+import re
+import signal
+import sys
+import threading
+import time
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache
+from datetime import datetime
 from pathlib import Path
 from dotenv import load_dotenv
 
-from aiogram import Bot, Dispatcher, F, Router
+from aiogram import Bot, Dispatcher, F, Router, BaseMiddleware
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
 from aiogram.filters import Command
 from aiogram.types import (
     Message, ReplyKeyboardMarkup, KeyboardButton,
@@ -16,7 +28,7 @@ from aiogram.types import (
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
-from aiogram.filters import Command, CommandStart, StateFilter
+from aiogram.filters import Command, CommandObject, CommandStart, StateFilter
 
 # ===== НАСТРОЙКИ =====
 logging.basicConfig(
@@ -31,52 +43,289 @@ load_dotenv(dotenv_path=BASE_DIR / '.env', override=True)
 # Получаем токен из переменных среды
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 
-# Добавляем проверку токена перед запуском
-if not BOT_TOKEN or ":" not in BOT_TOKEN:
-    logger.error("❌ Токен бота невалиден или отсутствует!")
-    if not BOT_TOKEN:
-        logger.error("Токен не найден в переменных среды")
-    else:
-        logger.error(f"Текущий токен: {BOT_TOKEN}")
-    exit(1)
-
 ADMIN_IDS = [834553662, 553588882, 2054326653, 1852003919, 966420322, 1852003919, 922760341, 1297618468]
 
-# Файлы для хранения данных
-FAQ_FILE = BASE_DIR / "faq.txt"
-MAP_FILE = BASE_DIR / "map.txt"  # Теперь храним file_id
-MENU_FILE = BASE_DIR / "menu.txt"
-INFO_FILE = BASE_DIR / "section_info.txt"
-PHOTO_DATA_FILE = BASE_DIR / "photo_data.json"  # Хранилище file_id
+# Несколько форумов в одном процессе; без этого файла работает один бот с BOT_TOKEN
+TENANTS_FILE = Path(os.getenv("TENANTS_FILE", BASE_DIR / "tenants.json"))
+
+# Файлы для хранения данных (внутри каталога контента форума)
+FAQ_FILE = "faq.txt"
+MAP_FILE = "map.txt"  # Теперь храним file_id
+MENU_FILE = "menu.txt"
+INFO_FILE = "section_info.txt"
+PHOTO_DATA_FILE = "photo_data.json"  # Хранилище file_id
+APPEALS_FILE = "appeals.txt"
+PROFILES_DIR = Path(os.getenv("PROFILES_DIR", BASE_DIR / "profiles"))  # Сюда пишутся профили event loop
+
+
+# Числовая настройка из переменных среды
+def get_float_env(name, default=None):
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.error(f"Некорректное значение {name}: {value}")
+        return default
+
+
+# Трассировка медленных апдейтов: порог в мс (не задан — выключена)
+TRACE_SLOW_MS = get_float_env("TRACE_SLOW_MS")
+
+# Окно склейки похожих обращений, сек (0 — отправлять админам сразу)
+APPEAL_WINDOW_SECONDS = get_float_env("APPEAL_WINDOW_SECONDS", 60)
+
+PROFILE_DEFAULT_SECONDS = 10
+PROFILE_MAX_SECONDS = 120
+PROFILE_SAMPLE_INTERVAL = 0.005  # Период снятия стека, сек
+LAG_PROBE_INTERVAL = 0.05  # Период замера лага event loop, сек
+
+MESSAGE_LIMIT = 4096  # Лимит длины сообщения Telegram (в UTF-16)
+PAGES_CACHE_SIZE = 64  # Сколько разбитых текстов держать для кнопки "Показать ещё"
+
+tenants = {}  # id бота -> Tenant
+http_session = None  # Общий пул HTTP-соединений всех ботов
+
+
+# ===== ТРАССИРОВКА И ПРОФИЛИРОВАНИЕ =====
+class Span:
+    __slots__ = ("name", "start", "end", "children")
+
+    def __init__(self, name, start=None, end=None):
+        self.name = name
+        self.start = time.perf_counter() if start is None else start
+        self.end = end
+        self.children = []
+
+    @property
+    def duration_ms(self):
+        end = time.perf_counter() if self.end is None else self.end
+        return (end - self.start) * 1000
+
+    def format(self, depth=0):
+        lines = [f"{'  ' * depth}{self.name}: {self.duration_ms:.1f} мс"]
+        for child in self.children:
+            lines.extend(child.format(depth + 1))
+        return lines
+
+
+# Текущий спан апдейта; None — трассировка для этого апдейта не ведётся
+_current_span = contextvars.ContextVar("current_span", default=None)
 
-bot = None
+
+@contextmanager
+def trace_span(name):
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    span = Span(name)
+    parent.children.append(span)
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        span.end = time.perf_counter()
+        _current_span.reset(token)
 
 
-# Загрузка данных фото
-def load_photo_data():
-    if PHOTO_DATA_FILE.exists():
+class TraceUpdateMiddleware(BaseMiddleware):
+    """Корневой спан апдейта, логирует апдейты дольше порога"""
+
+    def __init__(self, threshold_ms):
+        self.threshold_ms = threshold_ms
+
+    async def __call__(self, handler, event, data):
+        tenant = data.get("tenant")
+        root = Span(f"update {event.update_id} ({event.event_type}, {getattr(tenant, 'name', '?')})")
+        token = _current_span.set(root)
         try:
-            with open(PHOTO_DATA_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except:
-            return {}
-    return {
-        "sections": {},
-        "program": [],
-        "directorate": [],
-        "map": None,
-        "menu": None
-    }
-
-
-# Сохранение данных фото
-def save_photo_data(data):
-    with open(PHOTO_DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+            return await handler(event, data)
+        finally:
+            root.end = time.perf_counter()
+            _current_span.reset(token)
+            if root.duration_ms >= self.threshold_ms:
+                logger.warning("🐢 Медленный апдейт:\n" + "\n".join(root.format()))
+
+
+class TraceRouterMiddleware(BaseMiddleware):
+    """Outer-middleware роутера: фильтры и обработчик"""
+
+    async def __call__(self, handler, event, data):
+        with trace_span("router"):
+            return await handler(event, data)
+
+
+class TraceHandlerMiddleware(BaseMiddleware):
+    """Inner-middleware: время фильтров и самого обработчика"""
+
+    async def __call__(self, handler, event, data):
+        parent = _current_span.get()
+        if parent is not None:
+            parent.children.append(Span("filters", start=parent.start, end=time.perf_counter()))
+
+        callback = getattr(data.get("handler"), "callback", None)
+        with trace_span(f"handler {getattr(callback, '__name__', '?')}"):
+            return await handler(event, data)
+
+
+class TraceRequestMiddleware(BaseRequestMiddleware):
+    """Спан на каждый вызов Bot API"""
+
+    async def __call__(self, make_request, bot, method):
+        with trace_span(f"api {type(method).__name__}"):
+            return await make_request(bot, method)
+
+
+def setup_tracing(dp: Dispatcher, session: AiohttpSession, threshold_ms: float):
+    dp.update.outer_middleware(TraceUpdateMiddleware(threshold_ms))
+    for observer in (router.message, router.callback_query):
+        observer.outer_middleware(TraceRouterMiddleware())
+        observer.middleware(TraceHandlerMiddleware())
+    session.middleware(TraceRequestMiddleware())
+    logger.info(f"Трассировка включена, порог {threshold_ms:.0f} мс")
+
+
+_profile_lock = asyncio.Lock()
+_background_tasks = set()
+
+
+def write_profile(samples: Counter, lags: list, duration: float) -> Path:
+    PROFILES_DIR.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+
+    # Стеки в формате collapsed (flamegraph.pl, speedscope)
+    profile_path = PROFILES_DIR / f"profile-{stamp}.folded"
+    with open(profile_path, "w", encoding="utf-8") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+
+    with open(PROFILES_DIR / f"profile-{stamp}.lag.json", "w", encoding="utf-8") as f:
+        json.dump({
+            "duration": duration,
+            "probe_interval": LAG_PROBE_INTERVAL,
+            "samples": sum(samples.values()),
+            "lag_ms": lags,
+        }, f, indent=2)
+
+    return profile_path
+
+
+def lag_summary(lags: list) -> str:
+    if not lags:
+        return "нет замеров"
+    ordered = sorted(lags)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return f"среднее {sum(ordered) / len(ordered):.1f} мс, p95 {p95:.1f} мс, макс {ordered[-1]:.1f} мс"
+
+
+# Семплирующий профиль потока event loop и замер его лага; None — профиль уже снимается
+async def capture_profile(duration: float):
+    loop = asyncio.get_running_loop()
+    loop_thread_id = threading.get_ident()
+    samples = Counter()
+    lags = []
+    stop = threading.Event()
+
+    def sampler():
+        while not stop.wait(PROFILE_SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(loop_thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                frame = frame.f_back
+            samples[";".join(reversed(stack))] += 1
+
+    # Между проверкой и захватом замка не должно быть await
+    if _profile_lock.locked():
+        return None
+
+    async with _profile_lock:
+        thread = threading.Thread(target=sampler, name="loop-profiler", daemon=True)
+        thread.start()
+        deadline = loop.time() + duration
+        try:
+            while loop.time() < deadline:
+                started = loop.time()
+                await asyncio.sleep(LAG_PROBE_INTERVAL)
+                lags.append(max(0.0, loop.time() - started - LAG_PROBE_INTERVAL) * 1000)
+        finally:
+            stop.set()
+            await asyncio.to_thread(thread.join)
+
+        path = await asyncio.to_thread(write_profile, samples, lags, duration)
+
+    summary = lag_summary(lags)
+    logger.info(f"Профиль сохранён в {path}, лаг event loop: {summary}")
+    return path, summary
+
+
+def setup_profile_signal():
+    # SIGUSR1 снимает профиль длительностью PROFILE_DEFAULT_SECONDS
+    if not hasattr(signal, "SIGUSR1"):
+        return
+
+    def on_signal():
+        if _profile_lock.locked():
+            logger.warning("Профилирование уже идёт, сигнал пропущен")
+            return
+        task = asyncio.create_task(capture_profile(PROFILE_DEFAULT_SECONDS))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, on_signal)
+    except (NotImplementedError, RuntimeError) as e:
+        logger.warning(f"Не удалось подписаться на SIGUSR1: {e}")
+
+
+# ===== ХРАНИЛИЩЕ =====
+# Общий для всех форумов слой работы с файлами контента
+_text_cache = {}  # путь -> ((mtime, размер), текст)
+
+
+def read_text(path: Path, default: str) -> str:
+    with trace_span(f"disk read {path.name}"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return default
+
+        # Перечитываем файл, только если он изменился
+        version = (stat.st_mtime_ns, stat.st_size)
+        cached = _text_cache.get(path)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        text = path.read_text(encoding="utf-8").strip()
+        _text_cache[path] = (version, text)
+        return text
+
+
+def write_text(path: Path, text: str):
+    with trace_span(f"disk write {path.name}"):
+        _text_cache.pop(path, None)
+        path.write_text(text, encoding="utf-8")
+
+
+def delete_file(path: Path):
+    with trace_span(f"disk unlink {path.name}"):
+        _text_cache.pop(path, None)
+        if path.exists():
+            path.unlink()
+
 
+def append_line(path: Path, line: str):
+    with trace_span(f"disk append {path.name}"), open(path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
 
-# Инициализация хранилища
-photo_data = load_photo_data()
+
+def write_json(path: Path, data):
+    with trace_span(f"disk write {path.name}"), open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
 
 
 # Состояния FSM
@@ -125,43 +374,354 @@ SECTIONS = {
     "press_service": "Пресс-служба"
 }
 
-APPEALS_FILE = BASE_DIR / "appeals.txt"
+# Тексты по умолчанию; форум может переопределить их в tenants.json
+DEFAULT_WELCOME_TEXT = (
+    "Привет, хранитель природы! 🌿 Рад видеть тебя на форуме «Экосистема. Заповедный край». "
+    "Я помогу тебе:\n\n"
+    "🏡 Комфортно устроиться в нашем экологичном жилом комплексе\n"
+    "📝 Найти ответы на частые вопросы\n"
+    "🗺 Посмотреть карту\n"
+    "👥 Познакомиться с командой организаторов\n"
+    "🍽 Узнать, чем сегодня кормят\n"
+    "📅 Посмотреть программу на день\n\n"
+    "Выбери нужное действие ниже ↓"
+)
+DEFAULT_MAP_CAPTION = "Держи карту территории Всероссийского экологического центра \"Экосистема\""
 
 # ===== ИНИЦИАЛИЗАЦИЯ =====
 router = Router()
-section_data = {}
+
+
+# ===== ДЛИННЫЕ СООБЩЕНИЯ =====
+_HTML_TOKEN = re.compile(r"<[^>]*>|&#?\w+;")
+_HTML_TAG = re.compile(r"<(/?)([a-zA-Z][\w-]*)[^>]*>")
+
+
+def utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+# Индекс конца окна от start, которое укладывается в budget единиц UTF-16
+def utf16_window_end(text: str, start: int, budget: int) -> int:
+    end = start
+    while end < len(text):
+        width = 2 if ord(text[end]) > 0xFFFF else 1
+        if width > budget:
+            break
+        budget -= width
+        end += 1
+    return max(end, start + 1)
+
+
+# Незакрытые теги после куска текста: список (имя, открывающий тег)
+def open_tags_after(text: str, stack: list) -> list:
+    stack = list(stack)
+    for match in _HTML_TAG.finditer(text):
+        closing, name = match.group(1), match.group(2).lower()
+        if not closing:
+            stack.append((name, match.group(0)))
+            continue
+        for i in range(len(stack) - 1, -1, -1):
+            if stack[i][0] == name:
+                del stack[i]
+                break
+    return stack
+
+
+# Место разреза: граница абзаца, затем строки, затем слова; не внутри тега или сущности.
+# Разделитель из первой половины окна не берём, чтобы не слать почти пустые части
+def find_cut(text: str, start: int, end: int, tokens: list) -> int:
+    cut = end
+    min_cut = start + (end - start) // 2
+    for separator in ("\n\n", "\n", " "):
+        pos = text.rfind(separator, min_cut, end)
+        if pos > start:
+            cut = pos
+            break
+
+    for token_start, token_end in tokens:
+        if token_start >= cut:
+            break
+        if token_start < cut < token_end:
+            cut = token_start if token_start > start else token_end
+            break
+    return cut
+
+
+@lru_cache(maxsize=256)
+def split_message(text: str, html: bool = False, limit: int = MESSAGE_LIMIT) -> tuple:
+    """Режет текст на части не длиннее limit, закрывая и переоткрывая HTML-теги на стыках"""
+    if utf16_len(text) <= limit:
+        return (text,)
+
+    tokens = [match.span() for match in _HTML_TOKEN.finditer(text)] if html else []
+    chunks = []
+    stack = []
+    pos = 0
+    while pos < len(text):
+        prefix = "".join(tag for _, tag in stack)
+        budget = limit - utf16_len(prefix)
+        while True:
+            end = utf16_window_end(text, pos, budget)
+            cut = end if end == len(text) else find_cut(text, pos, end, tokens)
+            piece = text[pos:cut].rstrip()
+            new_stack = open_tags_after(piece, stack) if html else []
+            suffix = "".join(f"</{name}>" for name, _ in reversed(new_stack))
+            chunk = prefix + piece + suffix
+            excess = utf16_len(chunk) - limit
+            if excess <= 0 or budget <= 1:
+                break
+            budget -= excess
+
+        if piece.strip():
+            chunks.append(chunk)
+        stack = new_stack
+        pos = cut
+        while pos < len(text) and text[pos] in " \n":
+            pos += 1
+
+    return tuple(chunks)
+
+
+long_pages = {}  # ключ -> (части, parse_mode), для кнопки "Показать ещё"
+
+
+def more_keyboard(key: str, index: int, total: int):
+    kb = InlineKeyboardBuilder()
+    kb.button(text=f"Показать ещё ▶ ({index + 1}/{total})", callback_data=f"more:{key}:{index}")
+    return kb.as_markup()
+
+
+# Отправка длинного текста частями; с paginate следующие части — по кнопке
+async def send_long(message: Message, text: str, parse_mode: str = None, paginate: bool = False):
+    chunks = split_message(text, html=parse_mode == "HTML")
+
+    if paginate and len(chunks) > 1:
+        key = f"{hash(chunks) & 0xFFFFFFFF:x}"
+        long_pages.pop(key, None)
+        long_pages[key] = (chunks, parse_mode)
+        while len(long_pages) > PAGES_CACHE_SIZE:
+            del long_pages[next(iter(long_pages))]
+        await message.answer(chunks[0], parse_mode=parse_mode, reply_markup=more_keyboard(key, 1, len(chunks)))
+        return
+
+    for chunk in chunks:
+        await message.answer(chunk, parse_mode=parse_mode)
+
+
+# ===== ФОРУМЫ =====
+class Tenant:
+    """Отдельный форум: свой бот, админы, разделы и каталог с контентом"""
+
+    def __init__(self, name: str, token: str, admin_ids, sections: dict, content_dir: Path,
+                 welcome_text: str = DEFAULT_WELCOME_TEXT, map_caption: str = DEFAULT_MAP_CAPTION):
+        self.name = name
+        self.token = token
+        self.admin_ids = list(admin_ids)
+        self.sections = dict(sections)
+        self.welcome_text = welcome_text
+        self.map_caption = map_caption
+        self.content_dir = content_dir
+        self.faq_file = content_dir / FAQ_FILE
+        self.menu_file = content_dir / MENU_FILE
+        self.info_file = content_dir / INFO_FILE
+        self.photo_data_file = content_dir / PHOTO_DATA_FILE
+        self.appeals_file = content_dir / APPEALS_FILE
+        self.bot = None
+        self.photo_data = {}
+        self.section_data = {}
+        self.appeal_coalescer = AppealCoalescer(APPEAL_WINDOW_SECONDS, self.notify_admins)
+
+    def load(self):
+        self.content_dir.mkdir(parents=True, exist_ok=True)
+        self.photo_data = self.load_photo_data()
+        self.load_info()
+
+    def is_admin(self, user_id: int) -> bool:
+        return user_id in self.admin_ids
+
+    # Загрузка данных фото
+    def load_photo_data(self):
+        if self.photo_data_file.exists():
+            try:
+                with open(self.photo_data_file, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except:
+                return {}
+        return {
+            "sections": {},
+            "program": [],
+            "directorate": [],
+            "map": None,
+            "menu": None
+        }
+
+    # Сохранение данных фото
+    def save_photo_data(self):
+        write_json(self.photo_data_file, self.photo_data)
+
+    def load_info(self):
+        if self.info_file.exists():
+            with open(self.info_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.strip().split("||", 1)
+                    if len(parts) == 2:
+                        key, text = parts
+                        self.section_data[key] = text
+
+    def save_info(self):
+        write_text(self.info_file, "".join(f"{key}||{text}\n" for key, text in self.section_data.items()))
+
+    async def notify_admins(self, text: str):
+        for admin_id in self.admin_ids:
+            try:
+                for chunk in split_message(text):
+                    await self.bot.send_message(admin_id, chunk)
+            except Exception as e:
+                logger.error(f"[{self.name}] Ошибка отправки сообщения админу {admin_id}: {e}")
+
+
+def load_tenants():
+    if not TENANTS_FILE.exists():
+        return [Tenant("default", BOT_TOKEN, ADMIN_IDS, SECTIONS, BASE_DIR)]
+
+    with open(TENANTS_FILE, "r", encoding="utf-8") as f:
+        config = json.load(f)
+
+    # Формат — см. tenants.example.json; токен берётся из переменной среды token_env,
+    # admin_ids, sections, welcome_text и map_caption по умолчанию общие,
+    # content_dir — относительно BASE_DIR
+    return [
+        Tenant(
+            name=item["name"],
+            token=os.getenv(item.get("token_env", "BOT_TOKEN")),
+            admin_ids=item.get("admin_ids", ADMIN_IDS),
+            sections=item.get("sections", SECTIONS),
+            content_dir=BASE_DIR / item.get("content_dir", item["name"]),
+            welcome_text=item.get("welcome_text", DEFAULT_WELCOME_TEXT),
+            map_caption=item.get("map_caption", DEFAULT_MAP_CAPTION),
+        )
+        for item in config
+    ]
+
+
+class TenantMiddleware(BaseMiddleware):
+    """Подставляет в обработчики форум, к боту которого пришёл апдейт"""
+
+    async def __call__(self, handler, event, data):
+        data["tenant"] = tenants[data["bot"].id]
+        return await handler(event, data)
 
 
 # ===== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ =====
-def is_admin(user_id: int) -> bool:
-    return user_id in ADMIN_IDS
+def is_valid_token(token) -> bool:
+    return bool(token) and len(token) >= 30 and ":" in token and token.split(":", 1)[0].isdigit()
 
 
-def load_info():
-    if INFO_FILE.exists():
-        with open(INFO_FILE, "r", encoding="utf-8") as f:
-            for line in f:
-                parts = line.strip().split("||", 1)
-                if len(parts) == 2:
-                    key, text = parts
-                    section_data[key] = text
+# id бота зашит в начало токена
+def bot_id_from_token(token: str) -> int:
+    return int(token.split(":", 1)[0])
 
 
-def save_info():
-    with open(INFO_FILE, "w", encoding="utf-8") as f:
-        for key, text in section_data.items():
-            f.write(f"{key}||{text}\n")
+async def forward_to_admins(tenant: Tenant, message: Message, text: str):
+    append_line(
+        tenant.appeals_file,
+        f"{message.date.isoformat()}||{message.from_user.id}||{message.from_user.full_name}||{message.text}"
+    )
 
+    await tenant.appeal_coalescer.add(message, text)
 
-async def forward_to_admins(message: Message, text: str):
-    with open(APPEALS_FILE, "a", encoding="utf-8") as f:
-        f.write(f"{message.date.isoformat()}||{message.from_user.id}||{message.from_user.full_name}||{message.text}\n")
 
-    for admin_id in ADMIN_IDS:
-        try:
-            await bot.send_message(admin_id, text)
-        except Exception as e:
-            logger.error(f"Ошибка отправки сообщения админу {admin_id}: {e}")
+# ===== СКЛЕЙКА ОБРАЩЕНИЙ =====
+# Команда и палатка из формы "вопрос, ФИО, номер команды, номер палатки"
+def parse_team_tent(text: str):
+    parts = [part.strip() for part in text.split(",")]
+    if len(parts) < 3:
+        return None
+    team, tent = (re.search(r"\d+", part) for part in parts[-2:])
+    if not team or not tent:
+        return None
+    return team.group(), tent.group()
+
+
+def appeal_keys(message: Message):
+    keys = [("user", message.from_user.id, " ".join(message.text.lower().split()))]
+    team_tent = parse_team_tent(message.text)
+    if team_tent:
+        keys.append(("tent", *team_tent))
+    return keys
+
+
+class AppealGroup:
+    __slots__ = ("keys", "reports", "task")
+
+    def __init__(self):
+        self.keys = set()
+        self.reports = {}  # повторное обращение -> число повторов (первое уже отправлено)
+        self.task = None
+
+    @property
+    def count(self):
+        return sum(self.reports.values())
+
+    def render(self, window: float) -> str:
+        lines = [f"🔁 Ещё похожих обращений за {window:g} сек: {self.count}"]
+        for text, repeats in self.reports.items():
+            lines.append(text if repeats == 1 else f"{text}\n(повторов: {repeats})")
+        return "\n\n———\n\n".join(lines)
+
+
+class AppealCoalescer:
+    """Первое обращение шлёт админам сразу, похожие за окно — одной сводкой в конце окна"""
+
+    def __init__(self, window: float, notify):
+        self.window = window
+        self.notify = notify
+        self.groups = {}  # ключ -> AppealGroup
+
+    async def add(self, message: Message, text: str):
+        if self.window <= 0:
+            await self.notify(text)
+            return
+
+        keys = appeal_keys(message)
+        group = next((self.groups[key] for key in keys if key in self.groups), None)
+        is_new = group is None
+        if is_new:
+            group = AppealGroup()
+            group.task = asyncio.create_task(self._flush_later(group))
+        else:
+            group.reports[text] = group.reports.get(text, 0) + 1
+
+        # Ключи регистрируем до await, чтобы параллельные дубли попали в эту же группу
+        for key in keys:
+            if self.groups.setdefault(key, group) is group:
+                group.keys.add(key)
+
+        if is_new:
+            await self.notify(text)
+
+    async def _flush_later(self, group: AppealGroup):
+        # Отвязываемся от трассировки апдейта, создавшего группу
+        _current_span.set(None)
+        await asyncio.sleep(self.window)
+        group.task = None
+        await self._flush(group)
+
+    async def _flush(self, group: AppealGroup):
+        for key in group.keys:
+            if self.groups.get(key) is group:
+                del self.groups[key]
+        if group.reports:
+            await self.notify(group.render(self.window))
+
+    async def flush_all(self):
+        pending = {id(group): group for group in self.groups.values()}.values()
+        for group in list(pending):
+            if group.task:
+                group.task.cancel()
+            await self._flush(group)
+
 
 
 # ===== КЛАВИАТУРЫ =====
@@ -178,9 +738,9 @@ main_kb = ReplyKeyboardMarkup(
 )
 
 
-def section_keyboard():
+def section_keyboard(sections: dict):
     kb = InlineKeyboardBuilder()
-    for key, name in SECTIONS.items():
+    for key, name in sections.items():
         kb.button(text=name, callback_data=f"section:{key}")
     kb.adjust(2)
     return kb.as_markup()
@@ -188,8 +748,8 @@ def section_keyboard():
 
 # ===== ОБРАБОТЧИКИ КОМАНД =====
 @router.message(Command("setfaq"))
-async def set_faq(message: Message, state: FSMContext):
-    if not is_admin(message.from_user.id):
+async def set_faq(message: Message, state: FSMContext, tenant: Tenant):
+    if not tenant.is_admin(message.from_user.id):
         await message.answer("⛔ Только администратор может использовать эту команду.")
         return
     await message.answer("✏️ Отправьте новый текст FAQ целиком:")
@@ -197,9 +757,9 @@ async def set_faq(message: Message, state: FSMContext):
 
 
 @router.message(SetFAQ.waiting_for_text)
-async def save_faq_text(message: Message, state: FSMContext):
+async def save_faq_text(message: Message, state: FSMContext, tenant: Tenant):
     try:
-        FAQ_FILE.write_text(message.text.strip(), encoding="utf-8")
+        write_text(tenant.faq_file, message.text.strip())
         await message.answer("✅ FAQ успешно обновлён.")
     except Exception as e:
         logger.error(f"Ошибка сохранения FAQ: {e}")
@@ -209,9 +769,9 @@ async def save_faq_text(message: Message, state: FSMContext):
 
 # ===== ОБРАБОТЧИК ПРОГРАММЫ НА ДЕНЬ =====
 @router.message(F.text == "📅 Программа на день")
-async def daily_program(message: Message):
+async def daily_program(message: Message, tenant: Tenant):
     try:
-        program_photos = photo_data.get("program", [])
+        program_photos = tenant.photo_data.get("program", [])
 
         if not program_photos:
             await message.answer("Программа на день пока не загружена.")
@@ -235,27 +795,27 @@ async def daily_program(message: Message):
 
 # ===== АДМИН-КОМАНДЫ ДЛЯ ПРОГРАММЫ =====
 @router.message(Command("setprogram"))
-async def set_program_start(message: Message, state: FSMContext):
-    if not is_admin(message.from_user.id):
+async def set_program_start(message: Message, state: FSMContext, tenant: Tenant):
+    if not tenant.is_admin(message.from_user.id):
         await message.answer("⛔ Только администратор может использовать эту команду.")
         return
 
     # Очищаем предыдущие фото
-    photo_data["program"] = []
-    save_photo_data(photo_data)
+    tenant.photo_data["program"] = []
+    tenant.save_photo_data()
 
     await message.answer("Отправляйте фото программы по одному. Для завершения отправьте /done")
     await state.set_state(SetProgram.waiting_for_photos)
 
 
 @router.message(SetProgram.waiting_for_photos, F.photo)
-async def save_program_photo(message: Message, state: FSMContext):
+async def save_program_photo(message: Message, state: FSMContext, tenant: Tenant):
     try:
         file_id = message.photo[-1].file_id
-        photo_data["program"].append(file_id)
-        save_photo_data(photo_data)
+        tenant.photo_data["program"].append(file_id)
+        tenant.save_photo_data()
 
-        count = len(photo_data["program"])
+        count = len(tenant.photo_data["program"])
         await message.answer(f"✅ Фото {count} сохранено.")
     except Exception as e:
         logger.error(f"Ошибка сохранения фото программы: {e}")
@@ -263,43 +823,29 @@ async def save_program_photo(message: Message, state: FSMContext):
 
 
 @router.message(Command("done"), SetProgram.waiting_for_photos)
-async def finish_program_upload(message: Message, state: FSMContext):
-    count = len(photo_data["program"])
+async def finish_program_upload(message: Message, state: FSMContext, tenant: Tenant):
+    count = len(tenant.photo_data["program"])
     await message.answer(f"✅ Программа обновлена! Загружено {count} фото.")
     await state.clear()
 
 
 # ===== ОСНОВНЫЕ ОБРАБОТЧИКИ =====
 @router.message(CommandStart())
-async def start(message: Message):
-    welcome_text = (
-        "Привет, хранитель природы! 🌿 Рад видеть тебя на форуме «Экосистема. Заповедный край». "
-        "Я помогу тебе:\n\n"
-        "🏡 Комфортно устроиться в нашем экологичном жилом комплексе\n"
-        "📝 Найти ответы на частые вопросы\n"
-        "🗺 Посмотреть карту\n"
-        "👥 Познакомиться с командой организаторов\n"
-        "🍽 Узнать, чем сегодня кормят\n"
-        "📅 Посмотреть программу на день\n\n"
-        "Выбери нужное действие ниже ↓"
-    )
-    await message.answer(welcome_text, reply_markup=main_kb)
+async def start(message: Message, tenant: Tenant):
+    await message.answer(tenant.welcome_text, reply_markup=main_kb)
 
 
 @router.message(F.text == "📝 Найти ответы на вопросы")
-async def faq(message: Message):
+async def faq(message: Message, tenant: Tenant):
     try:
-        if FAQ_FILE.exists():
-            text = FAQ_FILE.read_text(encoding="utf-8").strip()
-        else:
-            text = "❓ Часто задаваемые вопросы пока не добавлены."
+        text = read_text(tenant.faq_file, "❓ Часто задаваемые вопросы пока не добавлены.")
 
         faq_text = (
             "Здесь мы собрали часто задаваемые вопросы. Просмотри, вдруг ты найдешь здесь ответ для себя:\n\n"
             f"{text}\n\n"
             "Если ответ не удалось найти, то задай его кураторам команды"
         )
-        await message.answer(faq_text)
+        await send_long(message, faq_text, paginate=True)
     except Exception as e:
         logger.error(f"Ошибка загрузки FAQ: {e}")
         await message.answer("❌ Произошла ошибка при загрузке FAQ.")
@@ -322,7 +868,7 @@ async def household_prompt(message: Message, state: FSMContext):
 
 
 @router.message(StateFilter(FSMFillForm.obrsahenie), F.text)
-async def forward_to_admin(message: Message, state: FSMContext):
+async def forward_to_admin(message: Message, state: FSMContext, tenant: Tenant):
     if message.text.lower() in ["отмена", "/cancel", "❌ отмена"]:
         await message.answer("❌ Обращение отменено", reply_markup=main_kb)
         await state.clear()
@@ -332,6 +878,7 @@ async def forward_to_admin(message: Message, state: FSMContext):
         await message.answer("✅ Ваше сообщение отправлено администраторам.", reply_markup=main_kb)
         user = message.from_user
         await forward_to_admins(
+            tenant,
             message,
             f"📩 Бытовое обращение от @{user.username or user.full_name} (ID: {user.id}):\n\n{message.text}"
         )
@@ -342,29 +889,29 @@ async def forward_to_admin(message: Message, state: FSMContext):
 
 
 @router.message(F.text == "👥 Познакомиться с дирекцией Форума")
-async def directorate(message: Message):
+async def directorate(message: Message, tenant: Tenant):
     directorate_text = (
         "Смотри, какие замечательные люди создают наш Форум! "
         "Если будешь встречать их, обязательно поблагодари за их работу 😉\n\n"
         "Выбери необходимую службу:"
     )
-    await message.answer(directorate_text, reply_markup=section_keyboard())
+    await message.answer(directorate_text, reply_markup=section_keyboard(tenant.sections))
 
 
 @router.callback_query(F.data.startswith("section:"))
-async def show_section(callback: CallbackQuery):
+async def show_section(callback: CallbackQuery, tenant: Tenant):
     try:
         section_id = callback.data.split(":")[1]
-        name = SECTIONS.get(section_id, "Неизвестно")
-        text = section_data.get(section_id, "Нет описания.")
+        name = tenant.sections.get(section_id, "Неизвестно")
+        text = tenant.section_data.get(section_id, "Нет описания.")
 
-        await callback.message.answer(f"📌 <b>{name}</b>\n\n{text}", parse_mode="HTML")
+        await send_long(callback.message, f"📌 <b>{name}</b>\n\n{text}", parse_mode="HTML")
 
         # Определяем источник фото
         if section_id == "directorate":
-            file_ids = photo_data.get("directorate", [])
+            file_ids = tenant.photo_data.get("directorate", [])
         else:
-            file_ids = photo_data.get("sections", {}).get(section_id, [])
+            file_ids = tenant.photo_data.get("sections", {}).get(section_id, [])
 
         if not file_ids:
             await callback.message.answer("❌ Фото пока не загружены.")
@@ -387,13 +934,32 @@ async def show_section(callback: CallbackQuery):
     await callback.answer()
 
 
+@router.callback_query(F.data.startswith("more:"))
+async def show_more(callback: CallbackQuery):
+    try:
+        _, key, index = callback.data.split(":")
+        index = int(index)
+        pages = long_pages.get(key)
+        if pages is None or index >= len(pages[0]):
+            await callback.answer("Текст устарел, откройте раздел заново.", show_alert=True)
+            return
+
+        chunks, parse_mode = pages
+        await callback.message.edit_reply_markup(reply_markup=None)
+        markup = more_keyboard(key, index + 1, len(chunks)) if index + 1 < len(chunks) else None
+        await callback.message.answer(chunks[index], parse_mode=parse_mode, reply_markup=markup)
+    except Exception as e:
+        logger.error(f"Ошибка показа продолжения: {e}")
+        await callback.message.answer("❌ Произошла ошибка при загрузке информации.")
+    await callback.answer()
+
+
 @router.message(F.text == "🗺 Посмотреть карту")
-async def show_map(message: Message):
+async def show_map(message: Message, tenant: Tenant):
     try:
-        map_text = "Держи карту территории Всероссийского экологического центра \"Экосистема\""
-        await message.answer(map_text)
+        await message.answer(tenant.map_caption)
 
-        map_file_id = photo_data.get("map")
+        map_file_id = tenant.photo_data.get("map")
         if map_file_id:
             await message.answer_photo(map_file_id)
         else:
@@ -404,19 +970,16 @@ async def show_map(message: Message):
 
 
 @router.message(F.text == "🍽 Узнать, чем сегодня кормят")
-async def show_menu(message: Message):
+async def show_menu(message: Message, tenant: Tenant):
     try:
         menu_text = "Вот меню столовой на сегодня.\nПриятного аппетита!\n\n"
 
-        if MENU_FILE.exists():
-            menu_text += MENU_FILE.read_text(encoding="utf-8").strip()
-        else:
-            menu_text += "Меню на сегодня пока не загружено."
+        menu_text += read_text(tenant.menu_file, "Меню на сегодня пока не загружено.")
 
-        await message.answer(menu_text)
+        await send_long(message, menu_text)
 
         # Показываем фото меню, если есть
-        menu_photo_id = photo_data.get("menu")
+        menu_photo_id = tenant.photo_data.get("menu")
         if menu_photo_id:
             await message.answer_photo(menu_photo_id)
     except Exception as e:
@@ -428,13 +991,13 @@ async def show_menu(message: Message):
 
 # ===== КОМАНДА ДЛЯ ЗАГРУЗКИ ФОТО ДИРЕКЦИИ ОТДЕЛЬНО =====
 @router.message(Command("upload_director_photos"))
-async def upload_director_photos(message: Message, state: FSMContext):
-    if not is_admin(message.from_user.id):
+async def upload_director_photos(message: Message, state: FSMContext, tenant: Tenant):
+    if not tenant.is_admin(message.from_user.id):
         return await message.answer("⛔️ Только для админов.")
 
     # Очищаем предыдущие фото
-    photo_data["directorate"] = []
-    save_photo_data(photo_data)
+    tenant.photo_data["directorate"] = []
+    tenant.save_photo_data()
 
     await message.answer(
         "📸 Отправляйте фото для дирекции по одному. "
@@ -445,13 +1008,13 @@ async def upload_director_photos(message: Message, state: FSMContext):
 
 
 @router.message(UploadDirectorPhotos.waiting_for_photos, F.photo)
-async def save_director_photo(message: Message, state: FSMContext):
+async def save_director_photo(message: Message, state: FSMContext, tenant: Tenant):
     try:
         file_id = message.photo[-1].file_id
-        photo_data["directorate"].append(file_id)
-        save_photo_data(photo_data)
+        tenant.photo_data["directorate"].append(file_id)
+        tenant.save_photo_data()
 
-        count = len(photo_data["directorate"])
+        count = len(tenant.photo_data["directorate"])
         await message.answer(f"✅ Фото {count} сохранено в раздел дирекции.")
     except Exception as e:
         logger.error(f"Ошибка сохранения фото дирекции: {e}")
@@ -459,20 +1022,20 @@ async def save_director_photo(message: Message, state: FSMContext):
 
 
 @router.message(Command("done"), UploadDirectorPhotos.waiting_for_photos)
-async def finish_director_upload(message: Message, state: FSMContext):
-    count = len(photo_data["directorate"])
+async def finish_director_upload(message: Message, state: FSMContext, tenant: Tenant):
+    count = len(tenant.photo_data["directorate"])
     await message.answer(f"✅ Загрузка фото дирекции завершена! Добавлено {count} фото.")
     await state.clear()
 
 
 @router.message(Command("addinfo"))
-async def add_info_start(message: Message, state: FSMContext):
-    if not is_admin(message.from_user.id):
+async def add_info_start(message: Message, state: FSMContext, tenant: Tenant):
+    if not tenant.is_admin(message.from_user.id):
         await message.answer("⛔ Только администратор может использовать эту команду.")
         return
 
     kb = InlineKeyboardBuilder()
-    for k, v in SECTIONS.items():
+    for k, v in tenant.sections.items():
         kb.button(text=v, callback_data=f"admin_set:{k}")
     kb.adjust(2)
     await message.answer("Выберите раздел:", reply_markup=kb.as_markup())
@@ -496,23 +1059,23 @@ async def admin_set_text(message: Message, state: FSMContext):
 
 
 @router.message(AddInfo.waiting_for_photos, F.photo)
-async def admin_save_photos(message: Message, state: FSMContext):
+async def admin_save_photos(message: Message, state: FSMContext, tenant: Tenant):
     try:
         data = await state.get_data()
         section_id = data["section_id"]
 
         # Инициализируем хранилище для раздела, если нужно
-        if "sections" not in photo_data:
-            photo_data["sections"] = {}
-        if section_id not in photo_data["sections"]:
-            photo_data["sections"][section_id] = []
+        if "sections" not in tenant.photo_data:
+            tenant.photo_data["sections"] = {}
+        if section_id not in tenant.photo_data["sections"]:
+            tenant.photo_data["sections"][section_id] = []
 
         # Сохраняем file_id
         file_id = message.photo[-1].file_id
-        photo_data["sections"][section_id].append(file_id)
-        save_photo_data(photo_data)
+        tenant.photo_data["sections"][section_id].append(file_id)
+        tenant.save_photo_data()
 
-        count = len(photo_data["sections"][section_id])
+        count = len(tenant.photo_data["sections"][section_id])
         await message.answer(f"✅ Фото {count} сохранено.")
     except Exception as e:
         logger.error(f"Ошибка сохранения фото: {e}")
@@ -520,14 +1083,14 @@ async def admin_save_photos(message: Message, state: FSMContext):
 
 
 @router.message(Command("done"), AddInfo.waiting_for_photos)
-async def admin_done_uploading(message: Message, state: FSMContext):
+async def admin_done_uploading(message: Message, state: FSMContext, tenant: Tenant):
     try:
         data = await state.get_data()
         section_id = data["section_id"]
-        section_data[section_id] = data["text"]
-        save_info()
+        tenant.section_data[section_id] = data["text"]
+        tenant.save_info()
 
-        count = len(photo_data["sections"].get(section_id, []))
+        count = len(tenant.photo_data["sections"].get(section_id, []))
         await message.answer(f"✅ Описание и {count} фото обновлены.")
     except Exception as e:
         logger.error(f"Ошибка завершения загрузки: {e}")
@@ -537,40 +1100,40 @@ async def admin_done_uploading(message: Message, state: FSMContext):
 
 # ДОБАВЛЕНИЕ И УДАЛЕНИЕ АДМИНОВ
 @router.message(Command("addadmin"))
-async def add_admin(message: Message):
-    if message.from_user.id not in ADMIN_IDS:
+async def add_admin(message: Message, tenant: Tenant):
+    if message.from_user.id not in tenant.admin_ids:
         return await message.answer("⛔️ Только текущий админ может добавить другого администратора.")
     if not message.reply_to_message:
         return await message.answer("Ответьте на сообщение пользователя, которого хотите сделать админом.")
     new_admin_id = message.reply_to_message.from_user.id
-    if new_admin_id in ADMIN_IDS:
+    if new_admin_id in tenant.admin_ids:
         return await message.answer("✅ Этот пользователь уже админ.")
-    ADMIN_IDS.append(new_admin_id)
+    tenant.admin_ids.append(new_admin_id)
     await message.answer(f"✅ Пользователь {new_admin_id} добавлен в администраторы.")
 
 
 @router.message(Command("listadmins"))
-async def list_admins(message: Message):
-    if not is_admin(message.from_user.id):
+async def list_admins(message: Message, tenant: Tenant):
+    if not tenant.is_admin(message.from_user.id):
         return
-    admins = "\n".join(str(i) for i in ADMIN_IDS)
+    admins = "\n".join(str(i) for i in tenant.admin_ids)
     await message.answer(f"📋 Список админов:\n{admins}")
 
 
 # УПРОЩЕННЫЕ КОМАНДЫ ДЛЯ ОБНОВЛЕНИЯ МЕНЮ, КАРТЫ
 @router.message(Command("setmap"))
-async def set_map(message: Message):
-    if not is_admin(message.from_user.id):
+async def set_map(message: Message, tenant: Tenant):
+    if not tenant.is_admin(message.from_user.id):
         return await message.answer("⛔️ Только для админов.")
     await message.answer("📎 Пришлите новое фото карты.")
 
 
 @router.message(F.photo, Command("setmap"))
-async def save_map_photo(message: Message):
+async def save_map_photo(message: Message, tenant: Tenant):
     try:
         file_id = message.photo[-1].file_id
-        photo_data["map"] = file_id
-        save_photo_data(photo_data)
+        tenant.photo_data["map"] = file_id
+        tenant.save_photo_data()
         await message.answer("✅ Карта обновлена.")
     except Exception as e:
         logger.error(f"Ошибка сохранения карты: {e}")
@@ -578,8 +1141,8 @@ async def save_map_photo(message: Message):
 
 
 @router.message(Command("setmenu"))
-async def set_menu_start(message: Message, state: FSMContext):
-    if not is_admin(message.from_user.id):
+async def set_menu_start(message: Message, state: FSMContext, tenant: Tenant):
+    if not tenant.is_admin(message.from_user.id):
         return await message.answer("⛔️ Только для админов.")
     await message.answer(
         "📄 Пришлите текст или фото нового меню.\n"
@@ -588,12 +1151,12 @@ async def set_menu_start(message: Message, state: FSMContext):
     await state.set_state(SetMenu.waiting_for_content)
 
 @router.message(SetMenu.waiting_for_content, F.text)
-async def set_menu_text(message: Message, state: FSMContext):
+async def set_menu_text(message: Message, state: FSMContext, tenant: Tenant):
     try:
-        MENU_FILE.write_text(message.text.strip(), encoding="utf-8")
+        write_text(tenant.menu_file, message.text.strip())
         # Очищаем фото меню, если был текст
-        photo_data["menu"] = None
-        save_photo_data(photo_data)
+        tenant.photo_data["menu"] = None
+        tenant.save_photo_data()
         await message.answer("✅ Текстовое меню обновлено.")
     except Exception as e:
         logger.error(f"Ошибка сохранения меню: {e}")
@@ -601,14 +1164,13 @@ async def set_menu_text(message: Message, state: FSMContext):
     await state.clear()
 
 @router.message(SetMenu.waiting_for_content, F.photo)
-async def set_menu_photo(message: Message, state: FSMContext):
+async def set_menu_photo(message: Message, state: FSMContext, tenant: Tenant):
     try:
         file_id = message.photo[-1].file_id
-        photo_data["menu"] = file_id
-        save_photo_data(photo_data)
+        tenant.photo_data["menu"] = file_id
+        tenant.save_photo_data()
         # Очищаем текстовое меню, если было фото
-        if MENU_FILE.exists():
-            MENU_FILE.unlink()
+        delete_file(tenant.menu_file)
         await message.answer("✅ Фото меню обновлено.")
     except Exception as e:
         logger.error(f"Ошибка сохранения фото меню: {e}")
@@ -621,10 +1183,34 @@ async def cancel_menu_update(message: Message, state: FSMContext):
     await state.clear()
     
 
+@router.message(Command("profile"))
+async def profile_loop(message: Message, command: CommandObject, tenant: Tenant):
+    if not tenant.is_admin(message.from_user.id):
+        return await message.answer("⛔️ Только для админов.")
+    if _profile_lock.locked():
+        return await message.answer("⏳ Профилирование уже идёт, подождите.")
+
+    try:
+        duration = float(command.args) if command.args else PROFILE_DEFAULT_SECONDS
+    except ValueError:
+        return await message.answer("Использование: /profile [секунды]")
+    duration = max(1.0, min(duration, PROFILE_MAX_SECONDS))
+
+    await message.answer(f"🔬 Снимаю профиль event loop, {duration:.0f} сек...")
+    try:
+        result = await capture_profile(duration)
+        if result is None:
+            return await message.answer("⏳ Профилирование уже идёт, подождите.")
+        path, summary = result
+        await message.answer(f"✅ Профиль сохранён: {path.name}\nЛаг event loop: {summary}")
+    except Exception as e:
+        logger.error(f"Ошибка профилирования: {e}")
+        await message.answer("❌ Не удалось снять профиль.")
+
 
 @router.message(Command("helpadmin"))
-async def help_admin(message: Message):
-    if not is_admin(message.from_user.id):
+async def help_admin(message: Message, tenant: Tenant):
+    if not tenant.is_admin(message.from_user.id):
         return
     await message.answer(
         "🛠 Команды для админов:\n"
@@ -637,6 +1223,7 @@ async def help_admin(message: Message):
         "/listadmins — показать текущих админов\n"
         "/view_appeals — показать последние обращения\n"
         "/upload_director_photos — загрузить фото дирекции\n"
+        "/profile [сек] — снять профиль event loop\n"
         "/shutdown — остановить бота\n"
         "/done — завершить загрузку фото"
     )
@@ -644,19 +1231,22 @@ async def help_admin(message: Message):
 
 # ===== ЗАВЕРШЕНИЕ РАБОТЫ =====
 async def shutdown():
-    global bot
-    if bot:
+    if http_session:
         logger.info("Закрытие сессии бота...")
         try:
-            # Отправляем уведомление администраторам
-            for admin_id in ADMIN_IDS:
-                try:
-                    await bot.send_message(admin_id, "🔴 Бот выключается...")
-                except:
-                    pass
-
-            # Закрываем сессию
-            await bot.session.close()
+            for tenant in tenants.values():
+                # Досылаем накопленные обращения
+                await tenant.appeal_coalescer.flush_all()
+
+                # Отправляем уведомление администраторам
+                for admin_id in tenant.admin_ids:
+                    try:
+                        await tenant.bot.send_message(admin_id, "🔴 Бот выключается...")
+                    except:
+                        pass
+
+            # Закрываем общую сессию
+            await http_session.close()
             logger.info("Сессия закрыта корректно")
         except Exception as e:
             logger.error(f"Ошибка при закрытии сессии: {e}")
@@ -664,48 +1254,94 @@ async def shutdown():
         logger.warning("Бот не был инициализирован, закрытие не требуется")
 
 
+# Проверка подключения и настройка вебхука одного форума
+async def connect_tenant(tenant: Tenant) -> bool:
+    try:
+        me = await tenant.bot.get_me()
+        logger.info(f"[{tenant.name}] Бот успешно подключен: @{me.username} (ID: {me.id})")
+    except Exception as e:
+        logger.error(f"[{tenant.name}] Ошибка подключения к Telegram API: {e}")
+        logger.error("Проверьте:")
+        logger.error("1. Правильность токена")
+        logger.error("2. Доступность API Telegram с вашего сервера")
+        logger.error("3. Интернет-соединение")
+        return False
+
+    try:
+        await tenant.bot.delete_webhook(drop_pending_updates=True)
+        logger.info(f"[{tenant.name}] Вебхук успешно удален, режим polling")
+    except Exception as e:
+        logger.error(f"[{tenant.name}] Ошибка настройки вебхука: {e}")
+        return False
+
+    return True
+
+
 # ===== ЗАПУСК БОТА =====
 async def main():
-    global bot
+    global http_session
+
+    try:
+        configured = load_tenants()
+    except Exception as e:
+        logger.error(f"Не удалось прочитать {TENANTS_FILE}: {e}")
+        return
 
     # Улучшенная проверка токена
-    if not BOT_TOKEN or len(BOT_TOKEN) < 30 or ":" not in BOT_TOKEN:
-        logger.error("Неверный формат токена! Токен должен быть в формате '123456789:ABCdefGHIjklMnOpQRSTuVWXyz'")
+    valid = []
+    for tenant in configured:
+        if not is_valid_token(tenant.token):
+            logger.error(
+                f"[{tenant.name}] Неверный формат токена! "
+                "Токен должен быть в формате '123456789:ABCdefGHIjklMnOpQRSTuVWXyz'"
+            )
+            continue
+
+        # Два форума с одним ботом, именем или каталогом затёрли бы друг друга
+        duplicate = next(
+            (
+                other for other in valid
+                if bot_id_from_token(other.token) == bot_id_from_token(tenant.token)
+                or other.name == tenant.name
+                or other.content_dir.resolve() == tenant.content_dir.resolve()
+            ),
+            None
+        )
+        if duplicate:
+            logger.error(
+                f"[{tenant.name}] Форум пропущен: тот же бот, имя или каталог контента, "
+                f"что и у «{duplicate.name}». Проверьте token_env, name и content_dir в {TENANTS_FILE.name}"
+            )
+            continue
+        valid.append(tenant)
+    if not valid:
         return
 
     try:
-        # Загрузка данных
-        load_info()
+        # Один пул соединений с таймаутом на все боты
+        http_session = AiohttpSession(timeout=30)
 
-        # Инициализация бота с таймаутом
-        bot = Bot(token=BOT_TOKEN, session_timeout=30)
+        for tenant in valid:
+            # Загрузка данных
+            tenant.load()
+            tenant.bot = Bot(token=tenant.token, session=http_session)
+            if await connect_tenant(tenant):
+                tenants[tenant.bot.id] = tenant
 
-        # Проверка подключения
-        try:
-            me = await bot.get_me()
-            logger.info(f"Бот успешно подключен: @{me.username} (ID: {me.id})")
-        except Exception as e:
-            logger.error(f"Ошибка подключения к Telegram API: {e}")
-            logger.error("Проверьте:")
-            logger.error("1. Правильность токена")
-            logger.error("2. Доступность API Telegram с вашего сервера")
-            logger.error("3. Интернет-соединение")
+        if not tenants:
             return
 
         # Инициализация диспетчера
         dp = Dispatcher()
+        dp.update.outer_middleware(TenantMiddleware())
         dp.include_router(router)
 
-        # Настройка вебхука
-        try:
-            await bot.delete_webhook(drop_pending_updates=True)
-            logger.info("Вебхук успешно удален, режим polling")
-        except Exception as e:
-            logger.error(f"Ошибка настройки вебхука: {e}")
-            return
+        if TRACE_SLOW_MS is not None:
+            setup_tracing(dp, http_session, TRACE_SLOW_MS)
+        setup_profile_signal()
 
-        logger.info("Бот запущен и ожидает сообщений...")
-        await dp.start_polling(bot)
+        logger.info(f"Бот запущен и ожидает сообщений, форумов: {len(tenants)}...")
+        await dp.start_polling(*(tenant.bot for tenant in tenants.values()))
 
     except asyncio.CancelledError:
         logger.info("Получен сигнал завершения работы")